@@ -1,18 +1,43 @@
 # ai4agro_server.py — coleta (RSS + fallback), clusterização semântica, ontologia, grafo e hipótese curta (≤20 palavras)
 import os
 import json
+import functools
 import time
+from concurrent.futures import ThreadPoolExecutor
 from json import JSONDecodeError
 from typing import List, Dict, Any
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import feedparser
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from flask import Flask, render_template, jsonify, request
 
 import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+
+try:  # opcional: E/S JSON em C (sinais.json é lido a cada requisição)
+    import orjson
+except ImportError:
+    orjson = None
+
+try:  # opcional: tagging da ontologia em uma passada (pyahocorasick)
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:  # opcional: acelera a varredura densa de pares
+    from numba import njit
+except ImportError:
+    njit = None
+
+try:  # opcional: cosseno denso com dispatch SIMD (AVX-512/NEON)
+    import simsimd
+except ImportError:
+    simsimd = None
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 
@@ -35,6 +60,13 @@ HTTP_OPTS = dict(timeout=10, headers={
     "Accept": "application/rss+xml,application/xml,text/xml;q=0.9,*/*;q=0.8",
 })
 
+# sessão única (keep-alive + pool) compartilhada pelas threads de coleta
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16,
+                       max_retries=Retry(total=2, backoff_factor=0.3))
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
 # ========= Util: E/S segura =========
 def nrm(txt: str) -> str:
     return " ".join((txt or "").split()).strip()
@@ -43,6 +75,9 @@ def carregar_json(path: str, default):
     try:
         if not os.path.exists(path) or os.path.getsize(path) == 0:
             return default
+        if orjson is not None:
+            with open(path, "rb") as f:
+                return orjson.loads(f.read())
         with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
     except (JSONDecodeError, OSError, ValueError):
@@ -51,12 +86,48 @@ def carregar_json(path: str, default):
 def salvar_json(path: str, obj) -> None:
     os.makedirs(os.path.dirname(path), exist_ok=True)
     tmp = path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
+    if orjson is not None:
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False, indent=2)
     os.replace(tmp, path)
 
+def _mtime_sinais():
+    try:
+        return os.stat(DATA_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+def _mtime_onto():
+    try:
+        return os.stat(ONTO_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+# última leitura de sinais.json; só relê quando o mtime muda (salvar_sinais troca o arquivo).
+# "onto" é o mtime da ontologia com que os "conceitos" em memória foram conferidos
+_CACHE_SINAIS = {"mtime": -1, "onto": -1, "data": []}
+
 def carregar_sinais() -> List[Dict[str, Any]]:
-    return carregar_json(DATA_PATH, [])
+    m, mo = _mtime_sinais(), _mtime_onto()
+    if m == _CACHE_SINAIS["mtime"]:
+        data = _CACHE_SINAIS["data"]
+        if mo == _CACHE_SINAIS["onto"]:
+            return data
+        # ontologia editada depois da leitura: retagga em memória
+        retag = True
+    else:
+        data = carregar_json(DATA_PATH, [])
+        # "conceitos" é gravado junto com os sinais; retagga arquivos antigos sem ele
+        # ou gravados antes da última edição da ontologia
+        retag = (any("conceitos" not in s for s in data)
+                 or (m is not None and mo is not None and mo > m))
+    if retag:
+        taggear_por_ontologia(data, carregar_ontologia())
+    _CACHE_SINAIS.update(mtime=m, onto=mo, data=data)
+    return data
 
 def salvar_sinais(sinais: List[Dict[str, Any]]) -> None:
     salvar_json(DATA_PATH, sinais)
@@ -66,17 +137,36 @@ def carregar_ontologia() -> Dict[str, Any]:
     # indexa rapidamente
     for c in onto.get("conceitos", []):
         c["keywords_lc"] = [k.lower() for k in c.get("keywords", [])]
+    # autômato Aho–Corasick: keyword -> conceitos; uma só passada por título
+    if ahocorasick is not None:
+        kw_conceitos: Dict[str, set] = {}
+        for c in onto.get("conceitos", []):
+            for k in c["keywords_lc"]:
+                if k:
+                    kw_conceitos.setdefault(k, set()).add(c["nome"])
+        if kw_conceitos:
+            A = ahocorasick.Automaton()
+            for k, nomes in kw_conceitos.items():
+                A.add_word(k, tuple(nomes))
+            A.make_automaton()
+            onto["_ac"] = A
     return onto
 
 # ========= Coleta =========
 def parse_rss(url: str) -> List[Dict[str, str]]:
     itens = []
+    # sem fallback feedparser.parse(url): ele refaria o GET sem timeout
     try:
-        r = requests.get(url, **HTTP_OPTS)
+        r = SESSION.get(url, **HTTP_OPTS)
         r.raise_for_status()
+    except requests.RequestException as exc:
+        app.logger.warning("RSS indisponível %s: %s", url, exc)
+        return []
+    try:
         feed = feedparser.parse(r.content)
-    except Exception:
-        feed = feedparser.parse(url)
+    except Exception as exc:
+        app.logger.warning("RSS inválido %s: %s", url, exc)
+        return []
     for e in getattr(feed, "entries", []) or []:
         titulo = nrm(getattr(e, "title", ""))
         link = getattr(e, "link", "")
@@ -84,11 +174,12 @@ def parse_rss(url: str) -> List[Dict[str, str]]:
             itens.append({"titulo": titulo, "fonte": link})
     return itens
 
-def fallback_html_list(url: str, selector: str, attr: str = "href") -> List[Dict[str, str]]:
+def fallback_html_list(url: str, selector: str, attr: str = "href", tags=("a",)) -> List[Dict[str, str]]:
+    # tags: elementos que o parser mantém; devem cobrir os ancestrais usados no selector (ex.: "h3 a")
     try:
-        r = requests.get(url, timeout=10, headers={"User-Agent": HTTP_OPTS["headers"]["User-Agent"]})
+        r = SESSION.get(url, timeout=10, headers={"User-Agent": HTTP_OPTS["headers"]["User-Agent"]})
         r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
+        soup = BeautifulSoup(r.content, "lxml", parse_only=SoupStrainer(list(tags)))
         itens = []
         for a in soup.select(selector)[:25]:
             titulo = nrm(a.get_text())
@@ -102,9 +193,11 @@ def fallback_html_list(url: str, selector: str, attr: str = "href") -> List[Dict
 def gerar_sinais_automaticos(max_itens: int = 48) -> List[Dict[str, Any]]:
     sinais = []
     vistos = set()
-    # 1) RSS
-    for rss in RSS_FONTES:
-        for item in parse_rss(rss):
+    # 1) RSS — baixa os feeds em paralelo (I/O); dedup fica na thread chamadora, na ordem de RSS_FONTES
+    with ThreadPoolExecutor(max_workers=len(RSS_FONTES)) as ex:
+        resultados = list(ex.map(parse_rss, RSS_FONTES))
+    for itens in resultados:
+        for item in itens:
             if item["fonte"] in vistos:
                 continue
             vistos.add(item["fonte"])
@@ -120,7 +213,8 @@ def gerar_sinais_automaticos(max_itens: int = 48) -> List[Dict[str, Any]]:
         ))
         sinais.extend(fallback_html_list(
             "https://www.embrapa.br/busca-de-noticias",
-            "a.nome-noticia, a.card-title, h3 a"
+            "a.nome-noticia, a.card-title, h3 a",
+            tags=("a", "h3")
         ))
         arr, vistos = [], set()
         for it in sinais:
@@ -135,64 +229,144 @@ def gerar_sinais_automaticos(max_itens: int = 48) -> List[Dict[str, Any]]:
 
 # ========= Ontologia: tagging por keywords =========
 def taggear_por_ontologia(sinais: List[Dict[str, Any]], onto: Dict[str, Any]) -> None:
+    A = onto.get("_ac")
+    if A is not None:
+        for s in sinais:
+            t = s.get("titulo", "").lower()
+            s["conceitos"] = sorted({nome for _, nomes in A.iter(t) for nome in nomes})
+        return
+    conceitos = onto.get("conceitos", [])
     for s in sinais:
         t = s.get("titulo", "").lower()
-        tags = []
-        for c in onto.get("conceitos", []):
-            if any(k in t for k in c.get("keywords_lc", [])):
-                tags.append(c["nome"])
-        s["conceitos"] = sorted(list(set(tags)))
+        tags = set()
+        for c in conceitos:
+            for k in c.get("keywords_lc", []):
+                if k in t:
+                    tags.add(c["nome"])
+                    break
+        s["conceitos"] = sorted(tags)
 
 # ========= Clusterização semântica (TF-IDF + cosseno) =========
+# até este nº de títulos (e de células n×dim) a matriz de similaridade densa é barata; acima, usa o produto esparso
+CLUSTER_DENSO_MAX_N = 200
+CLUSTER_DENSO_MAX_CELULAS = 2_000_000
+
+if njit is not None:
+    # serial de propósito: é chamado de threads de requisição e, com a camada "workqueue" do Numba,
+    # kernels parallel=True concorrentes abortam o processo; com n ≤ 48 títulos o paralelismo não ganha nada
+    @njit(fastmath=True, cache=True)
+    def _pares_acima_numba(Xd, thr):
+        """Pares i<j com produto escalar >= thr (linhas de Xd já normalizadas)."""
+        n, dim = Xd.shape
+        # 1ª passada conta por linha, 2ª grava em buffers pré-alocados
+        cont = np.zeros(n, dtype=np.int64)
+        for i in range(n):
+            c = 0
+            for j in range(i + 1, n):
+                s = 0.0
+                for k in range(dim):
+                    s += Xd[i, k] * Xd[j, k]
+                if s >= thr:
+                    c += 1
+            cont[i] = c
+        ini = np.zeros(n + 1, dtype=np.int64)
+        ini[1:] = np.cumsum(cont)
+        ii = np.empty(ini[n], dtype=np.int32)
+        jj = np.empty(ini[n], dtype=np.int32)
+        vv = np.empty(ini[n], dtype=np.float32)
+        for i in range(n):
+            p = ini[i]
+            for j in range(i + 1, n):
+                s = 0.0
+                for k in range(dim):
+                    s += Xd[i, k] * Xd[j, k]
+                if s >= thr:
+                    ii[p] = i
+                    jj[p] = j
+                    vv[p] = s
+                    p += 1
+        return ii, jj, vv
+
+def _pares_densos(X, threshold: float):
+    """
+    Pares (i, j, score) com i<j acima do threshold, via matriz densa (n pequeno).
+    Linhas TF-IDF vazias (ex.: títulos '?' ou '!') têm similaridade 0 com tudo e não geram arestas.
+    """
+    n = X.shape[0]
+    if simsimd is not None:
+        # quantiza por linha para int8 (cosseno não depende da escala); dot int8 usa VNNI/NEON.
+        # o máximo de cada linha vira 127, então só linhas vazias (título sem tokens) ficam nulas em int8
+        Xd = X.toarray().astype(np.float32)
+        nz = X.getnnz(axis=1) > 0
+        mx = Xd.max(axis=1, keepdims=True)
+        escala = np.divide(127.0, mx, out=np.zeros_like(mx), where=nz[:, None])
+        Xq = np.clip(np.rint(Xd * escala), -127, 127).astype(np.int8)
+        S = 1.0 - np.asarray(simsimd.cdist(Xq, Xq, metric="cosine"))
+        # SimSIMD dá distância 0 entre duas linhas int8 nulas; linha vazia não tem similaridade com nada
+        S[~nz, :] = 0.0
+        S[:, ~nz] = 0.0
+    elif njit is not None:
+        return _pares_acima_numba(X.toarray().astype(np.float32), np.float32(threshold))
+    else:
+        # TfidfVectorizer(norm="l2"): X·Xᵀ já é o cosseno, sem renormalizar
+        S = (X @ X.T).toarray()
+    ii, jj = np.triu_indices(n, k=1)
+    vv = S[ii, jj]
+    keep = vv >= threshold
+    return ii[keep], jj[keep], vv[keep]
+
+def _pares_esparsos(X, threshold: float):
+    """Pares (i, j, score) com i<j acima do threshold, via produto esparso."""
+    # linhas já normalizadas (l2): X·Xᵀ é o cosseno e continua esparso (só pares com termos em comum)
+    S = (X @ X.T).tocoo()
+    keep = (S.row < S.col) & (S.data >= threshold)
+    return S.row[keep], S.col[keep], S.data[keep]
+
 def clusterizar(sinais: List[Dict[str, Any]], threshold: float = 0.24):
     """
     Retorna:
       - clusters: lista de listas de índices
-      - sim_edges: arestas (i,j,score) acima do threshold
+      - sim_edges: array int32 (k, 2) com os pares (i, j), i<j, acima do threshold
     """
     titulos = [s["titulo"] for s in sinais]
     if len(titulos) < 2:
-        return [[i for i in range(len(titulos))]], []
+        return [[i for i in range(len(titulos))]], np.empty((0, 2), dtype=np.int32)
 
     vec = TfidfVectorizer(
         strip_accents="unicode",
         lowercase=True,
         ngram_range=(1, 2),
         min_df=1,
-        max_df=0.95
+        max_df=0.95,
+        max_features=10_000,
+        sublinear_tf=True,
+        norm="l2"
     )
     X = vec.fit_transform(titulos)
-    S = cosine_similarity(X)
+    n = X.shape[0]
+    if n <= CLUSTER_DENSO_MAX_N and n * X.shape[1] <= CLUSTER_DENSO_MAX_CELULAS:
+        ii, jj, _ = _pares_densos(X, threshold)
+    else:
+        ii, jj, _ = _pares_esparsos(X, threshold)
     # grafo de similaridade
-    n = S.shape[0]
-    visited = [False]*n
-    edges = []
-    adj = [[] for _ in range(n)]
-    for i in range(n):
-        for j in range(i+1, n):
-            if S[i, j] >= threshold:
-                edges.append((i, j, float(S[i, j])))
-                adj[i].append(j)
-                adj[j].append(i)
+    edges = np.column_stack((ii, jj)).astype(np.int32, copy=False)
     # componentes conexas
-    clusters = []
-    for i in range(n):
-        if not visited[i]:
-            stack = [i]
-            comp = []
-            visited[i] = True
-            while stack:
-                u = stack.pop()
-                comp.append(u)
-                for v in adj[u]:
-                    if not visited[v]:
-                        visited[v] = True
-                        stack.append(v)
-            clusters.append(comp)
+    A = csr_matrix((np.ones(len(ii), dtype=np.int8), (ii, jj)), shape=(n, n))
+    n_cc, labels = connected_components(A, directed=False)
+    ordem = np.argsort(labels, kind="stable")
+    cortes = np.cumsum(np.bincount(labels, minlength=n_cc))[:-1]
+    clusters = [c.tolist() for c in np.split(ordem, cortes)]
     # ordena por tamanho
     clusters.sort(key=len, reverse=True)
     return clusters, edges
 
+@functools.lru_cache(maxsize=4)
+def _clusterizar_cached(mtime_sinais, mtime_onto):
+    """(sinais, clusters, edges) para uma versão de sinais.json + ontologia (os mtimes são a chave)."""
+    sinais = carregar_sinais()
+    clusters, edges = clusterizar(sinais)
+    return sinais, clusters, edges
+
 # ========= Hipótese curta (≤20 palavras, sem inventar texto) =========
 def gerar_hipotese_curta(sinais_cluster: List[Dict[str, Any]]) -> str:
     """
@@ -235,9 +409,8 @@ def dashboard():
     if not sinais:
         sinais = gerar_sinais_automaticos()
         if sinais:
+            taggear_por_ontologia(sinais, carregar_ontologia())
             salvar_sinais(sinais)
-    onto = carregar_ontologia()
-    taggear_por_ontologia(sinais, onto)
     return render_template("dashboard.html", sinais=sinais)
 
 @app.route("/api/refresh_sinais", methods=["POST"])
@@ -265,23 +438,23 @@ def api_graph():
         "edges":[{"source":"hipotese","target":"s0"}, {"source":"s0","target":"s1"}]
       }
     """
-    sinais = carregar_sinais()
-    onto = carregar_ontologia()
-    taggear_por_ontologia(sinais, onto)
+    sinais, clusters, edges = _clusterizar_cached(_mtime_sinais(), _mtime_onto())
 
     if not sinais:
         return jsonify({"titulo": "Cluster de Cenários Antecipativo", "hipotese": "Sem dados.", "nodes": [], "edges": []})
 
-    clusters, edges = clusterizar(sinais)
-    top = clusters[0] if clusters else list(range(len(sinais)))
+    # cópia: o cluster vem do cache e é complementado abaixo
+    top = list(clusters[0]) if clusters else list(range(len(sinais)))
     # reduz o cluster para 6–12 itens
     if len(top) > 12:
         top = top[:12]
     elif len(top) < 6 and len(clusters) > 1:
         # tenta complementar com próximo cluster
+        top_set = set(top)
         for c in clusters[1:]:
             for idx in c:
-                if idx not in top:
+                if idx not in top_set:
+                    top_set.add(idx)
                     top.append(idx)
                     if len(top) >= 6:
                         break
@@ -308,15 +481,12 @@ def api_graph():
     # liga hipotese a todos os sinais
     for loc_id in range(len(cluster_sinais)):
         graph_edges.append({"source": "hipotese", "target": f"s{loc_id}"})
-    # liga sinais com similaridade > threshold dentro do subgrafo
-    edge_set = set()
-    for (i, j, _) in edges:
-        if i in top and j in top:
-            a, b = id_map[i], id_map[j]
-            key = tuple(sorted([a, b]))
-            if key not in edge_set:
-                edge_set.add(key)
-                graph_edges.append({"source": a, "target": b})
+    # liga sinais com similaridade > threshold dentro do subgrafo (pares i<j já são únicos)
+    in_top = np.zeros(len(sinais), dtype=bool)
+    in_top[top] = True
+    sub = edges[in_top[edges[:, 0]] & in_top[edges[:, 1]]]
+    for i, j in sub.tolist():
+        graph_edges.append({"source": id_map[i], "target": id_map[j]})
 
     return jsonify({
         "titulo": "Cluster de Cenários Antecipativo",
@@ -325,6 +495,10 @@ def api_graph():
         "edges": graph_edges
     })
 
+# Produção (rotas de I/O em paralelo; rodar de dentro de AI4AgroFuture/, os caminhos são relativos):
+#   gunicorn -k gthread -w 2 --threads 8 -b 0.0.0.0:8001 ai4agro_server:app
+# No Windows: waitress-serve --listen=0.0.0.0:8001 ai4agro_server:app
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8001, debug=True)
+    # servidor de desenvolvimento; debug (reloader) só com FLASK_DEBUG=1
+    app.run(host="0.0.0.0", port=8001, debug=os.environ.get("FLASK_DEBUG") == "1", threaded=True)
 